@@ -27,10 +27,12 @@ the standard library).
 
 from __future__ import print_function, division, absolute_import
 
+import copy
 import errno
 import functools
 import json
 import logging
+import mmap
 import os
 import shlex
 import shutil
@@ -41,9 +43,58 @@ import tarfile
 import time
 import traceback
 import re
+from itertools import groupby
 from os.path import (abspath, basename, dirname, isdir, isfile, islink,
                      join, relpath, normpath)
 
+try:
+    # optional: a much faster drop-in for the conda-meta JSON work
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(
+            obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        ).decode('utf-8')
+except ImportError:
+    try:
+        import ujson
+
+        _json_loads = ujson.loads
+
+        def _json_dumps(obj):
+            return ujson.dumps(obj, indent=2, sort_keys=True)
+    except ImportError:
+        _json_loads = json.loads
+
+        def _json_dumps(obj):
+            return json.dumps(obj, indent=2, sort_keys=True)
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport; linking falls back to the
+    # serial code path.
+    ThreadPoolExecutor = None
+
+# os.scandir is Python 3.5+; callers fall back to os.listdir without it
+scandir = getattr(os, 'scandir', None)
+
+def _close_scandir(it):
+    # ScandirIterator.close() only exists on Python 3.6+
+    close = getattr(it, 'close', None)
+    if close is not None:
+        close()
+
+try:
+    # Optional, Linux-only: the python bindings for liburing allow
+    # batching unlink syscalls when deleting large trees (requires
+    # kernel >= 5.11).  Everything works without it.
+    import liburing
+except ImportError:
+    liburing = None
+
 try:
     from conda.lock import Locked
 except ImportError:
@@ -59,20 +110,60 @@ except ImportError:
         def __exit__(self, exc_type, exc_value, traceback):
             pass
 
+def _win_path_to_unix_standalone(path, root_prefix=""):
+    """Convert a path or ;-separated string of paths into a unix representation
+
+    Does not add cygdrive.  If you need that, set root_prefix to "/cygdrive"
+
+    Copy of conda.utils.win_path_to_unix for the standalone installer.
+    """
+    out = []
+    pos = 0
+    n = len(path)
+    while pos < n:
+        ch = path[pos]
+        is_drive = (('a' <= ch <= 'z' or 'A' <= ch <= 'Z') and
+                    pos + 2 < n and path[pos + 1] == ':' and
+                    path[pos + 2] in '/\\')
+        if is_drive and pos > 0:
+            prev = path[pos - 1]
+            if prev in ':/^' or 'a' <= prev <= 'z' or 'A' <= prev <= 'Z':
+                is_drive = False
+        if not is_drive:
+            out.append(ch)
+            pos += 1
+            continue
+        s = pos + 2
+        while s < n and path[s] in '/\\':
+            s += 1
+        k = s
+        while k < n and path[k] not in ':*?"<>|':
+            k += 1
+        body = path[s:k]
+        end = None
+        idx = len(body) - 1
+        while idx > 0:
+            if body[idx - 1] in '/\\' and body[idx] not in ';/\\':
+                end = idx + 1
+                break
+            idx -= 1
+        if end is None:
+            if not body or body[0] == ';':
+                out.append(ch)
+                pos += 1
+                continue
+            end = 1
+        found = path[pos:s + end].replace('\\', '/').replace(':', '')
+        out.append(root_prefix + '/' + found)
+        pos = s + end
+    return ''.join(out).replace(';/', ':/')
+
 try:
     from conda.utils import win_path_to_unix
 except ImportError:
-    def win_path_to_unix(path, root_prefix=""):
-        """Convert a path or ;-separated string of paths into a unix representation
-
-        Does not add cygdrive.  If you need that, set root_prefix to "/cygdrive"
-        """
-        path_re = '(?<![:/^a-zA-Z])([a-zA-Z]:[\/\\\\]+(?:[^:*?"<>|]+[\/\\\\]+)*[^:*?"<>|;\/\\\\]+?(?![a-zA-Z]:))'  # noqa
-
-        def translation(found_path):
-            found = found_path.group(1).replace("\\", "/").replace(":", "")
-            return root_prefix + "/" + found
-        return re.sub(path_re, translation, path).replace(";/", ":/")
+    # Make sure this still works as a standalone script for the Anaconda
+    # installer.
+    win_path_to_unix = _win_path_to_unix_standalone
 
 on_win = bool(sys.platform == "win32")
 
@@ -189,7 +280,16 @@ def _link(src, dst, linktype=LINK_HARD):
     elif linktype == LINK_COPY:
         # copy relative symlinks as symlinks
         if not on_win and islink(src) and not os.readlink(src).startswith('/'):
-            os.symlink(os.readlink(src), dst)
+            try:
+                # hardlinking the symlink itself saves the readlink +
+                # symlink syscall pair and lets environments share the
+                # cached inode
+                os.link(src, dst, follow_symlinks=False)
+            except (OSError, NotImplementedError, TypeError):
+                # cross-device link (EXDEV), filesystems that refuse
+                # hardlinks to symlinks (EPERM), or a Python too old for
+                # follow_symlinks
+                os.symlink(os.readlink(src), dst)
         else:
             shutil.copy2(src, dst)
     else:
@@ -208,6 +308,267 @@ def warn_failed_remove(function, path, exc_info):
     else:
         log.warn("Cannot remove, unknown reason: {0}".format(path))
 
+def _fast_rmtree(path, onerror=None):
+    """
+    Delete the directory tree rooted at `path`, using an explicit stack of
+    os.scandir iterators.  Unlike shutil.rmtree, this reuses the file type
+    already cached on each DirEntry instead of re-stat'ing every child,
+    which keeps deletion of very large trees (package caches, whole
+    environments) linear in the number of entries.
+
+    `onerror` follows the shutil.rmtree convention: when given, it is
+    called with (function, path, excinfo) and the error is swallowed;
+    otherwise the OSError propagates to the caller.
+    """
+    if scandir is None:
+        # Python < 3.5: no scandir, use the stdlib walker
+        shutil.rmtree(path, onerror=onerror)
+        return
+    stack = [(path, scandir(path))]
+    try:
+        while stack:
+            dirpath, scan = stack[-1]
+            entry = next(scan, None)
+            if entry is None:
+                # directory exhausted, remove it
+                _close_scandir(scan)
+                stack.pop()
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    if onerror is None:
+                        raise
+                    onerror(os.rmdir, dirpath, sys.exc_info())
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, scandir(entry.path)))
+                else:
+                    os.unlink(entry.path)
+            except OSError:
+                if onerror is None:
+                    raise
+                onerror(os.unlink, entry.path, sys.exc_info())
+    finally:
+        for dirpath, scan in stack:
+            _close_scandir(scan)
+
+# number of unlinkat submissions queued per io_uring_enter round-trip
+_URING_BATCH = 128
+
+def _uring_submit_unlink_batch(ring, paths):
+    """
+    Submit one unlinkat SQE per path and reap the completions.  Returns
+    the sub-list of paths whose unlink failed, for the caller to retry
+    or report with its own error handling.
+    """
+    # the encoded paths must stay alive until the CQEs are reaped
+    encoded = [p.encode(sys.getfilesystemencoding()) for p in paths]
+    for i, p in enumerate(encoded):
+        sqe = liburing.io_uring_get_sqe(ring)
+        liburing.io_uring_prep_unlinkat(sqe, liburing.AT_FDCWD, p, 0)
+        sqe.user_data = i
+    liburing.io_uring_submit_and_wait(ring, len(encoded))
+    cqes = liburing.io_uring_cqes()
+    failed = []
+    for _ in encoded:
+        liburing.io_uring_peek_cqe(ring, cqes)
+        # completions arrive in any order; user_data maps them back
+        if cqes[0].res < 0:
+            failed.append(paths[cqes[0].user_data])
+        liburing.io_uring_cqe_seen(ring, cqes[0])
+    return failed
+
+def _unlink_all_uring(paths):
+    """
+    Unlink `paths`, batching the syscalls through io_uring.  Returns the
+    paths that could not be unlinked; raises OSError if the ring cannot
+    be set up at all.
+    """
+    ring = liburing.io_uring()
+    ret = liburing.io_uring_queue_init(_URING_BATCH, ring, 0)
+    if ret < 0:
+        raise OSError(-ret, 'io_uring_queue_init failed')
+    failed = []
+    try:
+        for start in range(0, len(paths), _URING_BATCH):
+            failed.extend(_uring_submit_unlink_batch(
+                ring, paths[start:start + _URING_BATCH]))
+    finally:
+        liburing.io_uring_queue_exit(ring)
+    return failed
+
+def _rmdir_all_uring(paths):
+    """
+    Remove the directories in `paths`, batching the rmdirs through
+    io_uring.  Matches rm_empty_dir semantics: failures (ENOTEMPTY,
+    ENOENT, ...) are silently ignored.  Raises OSError if the ring
+    cannot be set up.
+    """
+    # completions within a batch race each other, so a parent must
+    # never share a batch with one of its children; directories of
+    # equal depth are independent, so group by depth, deepest first
+    by_depth = {}
+    for p in paths:
+        by_depth.setdefault(p.count(os.sep), []).append(p)
+
+    ring = liburing.io_uring()
+    ret = liburing.io_uring_queue_init(_URING_BATCH, ring, 0)
+    if ret < 0:
+        raise OSError(-ret, 'io_uring_queue_init failed')
+    try:
+        for depth in sorted(by_depth, reverse=True):
+            for start in range(0, len(by_depth[depth]), _URING_BATCH):
+                batch = by_depth[depth][start:start + _URING_BATCH]
+                encoded = [p.encode(sys.getfilesystemencoding())
+                           for p in batch]
+                for i, p in enumerate(encoded):
+                    sqe = liburing.io_uring_get_sqe(ring)
+                    liburing.io_uring_prep_unlinkat(sqe, liburing.AT_FDCWD, p,
+                                                    liburing.AT_REMOVEDIR)
+                    sqe.user_data = i
+                liburing.io_uring_submit_and_wait(ring, len(encoded))
+                cqes = liburing.io_uring_cqes()
+                for _ in encoded:
+                    liburing.io_uring_peek_cqe(ring, cqes)
+                    liburing.io_uring_cqe_seen(ring, cqes[0])
+    finally:
+        liburing.io_uring_queue_exit(ring)
+
+def _read_meta_files_uring(meta_dir, fnames):
+    """
+    Read the given files under `meta_dir`, pipelining the read syscalls
+    through io_uring.  The opens happen up front (dentry-cache bound and
+    cheap); the reads -- the part that can block on the disk -- are
+    submitted in _URING_BATCH-sized batches.  Returns a dict mapping
+    file name to its bytes; files that cannot be read in full are left
+    out, matching the serial path's IOError handling.  Raises OSError
+    when the ring cannot be set up.
+    """
+    ring = liburing.io_uring()
+    ret = liburing.io_uring_queue_init(_URING_BATCH, ring, 0)
+    if ret < 0:
+        raise OSError(-ret, 'io_uring_queue_init failed')
+    res = {}
+    try:
+        for start in range(0, len(fnames), _URING_BATCH):
+            batch = fnames[start:start + _URING_BATCH]
+            fds = []
+            bufs = []
+            try:
+                for fn in batch:
+                    fd = os.open(join(meta_dir, fn), os.O_RDONLY)
+                    fds.append(fd)
+                    bufs.append(bytearray(os.fstat(fd).st_size))
+                for i, fd in enumerate(fds):
+                    sqe = liburing.io_uring_get_sqe(ring)
+                    liburing.io_uring_prep_read(sqe, fd, bufs[i],
+                                                len(bufs[i]), 0)
+                    sqe.user_data = i
+                liburing.io_uring_submit_and_wait(ring, len(fds))
+                cqes = liburing.io_uring_cqes()
+                for _ in fds:
+                    liburing.io_uring_peek_cqe(ring, cqes)
+                    i = cqes[0].user_data
+                    if cqes[0].res == len(bufs[i]):
+                        res[batch[i]] = bytes(bufs[i])
+                    liburing.io_uring_cqe_seen(ring, cqes[0])
+            finally:
+                for fd in fds:
+                    os.close(fd)
+    finally:
+        liburing.io_uring_queue_exit(ring)
+    return res
+
+def _rename_bak_uring(meta_dir, dists):
+    """
+    Rename conda-meta/<dist>.json to .json.bak for every dist, batching
+    the renameats through io_uring against the directory fd and issuing
+    a single fsync on the directory at the end, instead of one implicit
+    metadata flush per rename.  Returns the dists whose rename failed;
+    raises OSError when the ring or the directory fd cannot be set up.
+    """
+    dirfd = os.open(meta_dir, os.O_RDONLY | os.O_DIRECTORY)
+    ring = liburing.io_uring()
+    ret = liburing.io_uring_queue_init(_URING_BATCH, ring, 0)
+    if ret < 0:
+        os.close(dirfd)
+        raise OSError(-ret, 'io_uring_queue_init failed')
+    enc = sys.getfilesystemencoding()
+    failed = []
+    try:
+        for start in range(0, len(dists), _URING_BATCH):
+            batch = dists[start:start + _URING_BATCH]
+            olds = [(d + '.json').encode(enc) for d in batch]
+            news = [(d + '.json.bak').encode(enc) for d in batch]
+            for i in range(len(batch)):
+                sqe = liburing.io_uring_get_sqe(ring)
+                liburing.io_uring_prep_renameat(sqe, dirfd, olds[i],
+                                                dirfd, news[i], 0)
+                sqe.user_data = i
+            liburing.io_uring_submit_and_wait(ring, len(batch))
+            cqes = liburing.io_uring_cqes()
+            for _ in batch:
+                liburing.io_uring_peek_cqe(ring, cqes)
+                if cqes[0].res < 0:
+                    failed.append(batch[cqes[0].user_data])
+                liburing.io_uring_cqe_seen(ring, cqes[0])
+        # one directory metadata flush covers all the renames above
+        sqe = liburing.io_uring_get_sqe(ring)
+        liburing.io_uring_prep_fsync(sqe, dirfd, 0)
+        liburing.io_uring_submit_and_wait(ring, 1)
+        cqes = liburing.io_uring_cqes()
+        liburing.io_uring_peek_cqe(ring, cqes)
+        liburing.io_uring_cqe_seen(ring, cqes[0])
+    finally:
+        liburing.io_uring_queue_exit(ring)
+        os.close(dirfd)
+    return failed
+
+def _io_uring_rmtree(path):
+    """
+    Delete the tree rooted at `path`, batching the per-file unlinks
+    through io_uring.  This cuts the number of syscall round-trips from
+    one per file to one per _URING_BATCH files, which dominates rm_rf
+    wall time on big package caches.  Raises OSError when the ring
+    cannot be set up (e.g. the kernel predates unlinkat support).
+    """
+    def retry(failed):
+        # retry failures synchronously so the errors surface as the
+        # usual OSError; a racing deleter is fine
+        for p in failed:
+            try:
+                os.unlink(p)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    ring = liburing.io_uring()
+    ret = liburing.io_uring_queue_init(_URING_BATCH, ring, 0)
+    if ret < 0:
+        raise OSError(-ret, 'io_uring_queue_init failed')
+    try:
+        dirs = [path]
+        batch = []
+        # `dirs` grows while we walk it, giving a BFS of the tree
+        for dirpath in dirs:
+            with os.scandir(dirpath) as scan:
+                for entry in scan:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    else:
+                        batch.append(entry.path)
+                        if len(batch) >= _URING_BATCH:
+                            retry(_uring_submit_unlink_batch(ring, batch))
+                            del batch[:]
+        if batch:
+            retry(_uring_submit_unlink_batch(ring, batch))
+        # children before parents
+        for dirpath in reversed(dirs):
+            os.rmdir(dirpath)
+    finally:
+        liburing.io_uring_queue_exit(ring)
+
 def rm_rf(path, max_retries=5, trash=True):
     """
     Completely delete path
@@ -227,9 +588,17 @@ def rm_rf(path, max_retries=5, trash=True):
             log.warn("Cannot remove, permission denied: {0}".format(path))
 
     elif isdir(path):
+        if liburing is not None and sys.platform.startswith('linux'):
+            try:
+                _io_uring_rmtree(path)
+                return
+            except (OSError, AttributeError):
+                # ring setup failed (kernel too old) or the binding lacks
+                # unlinkat; fall through to the retrying deleter
+                pass
         for i in range(max_retries):
             try:
-                shutil.rmtree(path, ignore_errors=False, onerror=warn_failed_remove)
+                _fast_rmtree(path, onerror=warn_failed_remove)
                 return
             except OSError as e:
                 msg = "Unable to delete %s\n%s\n" % (path, e)
@@ -259,8 +628,12 @@ def rm_rf(path, max_retries=5, trash=True):
                             raise
                             msg += "Retry with onerror failed (%s)\n" % e2
 
-                log.debug(msg + "Retrying after %s seconds..." % i)
-                time.sleep(i)
+                # capped exponential backoff, with the first retry
+                # immediate: the old time.sleep(i) burned up to 10s of
+                # wall time on a stubborn directory
+                delay = min(0.05 * (2 ** i), 1.0) if i else 0
+                log.debug(msg + "Retrying after %s seconds..." % delay)
+                time.sleep(delay)
         # Final time. pass exceptions to caller.
         shutil.rmtree(path, ignore_errors=False, onerror=warn_failed_remove)
 
@@ -283,11 +656,38 @@ def yield_lines(path):
         yield line
 
 
+def _read_lines(path):
+    """
+    Eager version of yield_lines for callers that want the whole file
+    anyway: one read + splitlines is much cheaper than driving the
+    buffered-IO line iterator through Python for multi-thousand-line
+    manifests like info/files.
+    """
+    with open(path, 'rb') as fi:
+        data = fi.read()
+    lines = (line.strip() for line in data.decode('utf-8').splitlines())
+    return [line for line in lines if line and not line.startswith('#')]
+
+
 prefix_placeholder = ('/opt/anaconda1anaconda2'
                       # this is intentionally split into parts,
                       # such that running this program on itself
                       # will leave it unchanged
                       'anaconda3')
+# the well-formed case of a has_prefix line: three fields (placeholder,
+# mode, filename), each either quoted or bare.  shlex handles the same
+# grammar but is a full lexer written in Python, ~10-20x slower per line.
+_has_prefix_pat = re.compile(r'^(?:"([^"]*)"|\'([^\']*)\'|(\S+))'
+                             r'\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))'
+                             r'\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))$')
+
+def _first_group(groups, i):
+    # each field above is one of three alternative groups; exactly one
+    # of them matched
+    for g in groups[i:i + 3]:
+        if g is not None:
+            return g
+
 def read_has_prefix(path):
     """
     reads `has_prefix` file and return dict mapping filenames to
@@ -296,6 +696,13 @@ def read_has_prefix(path):
     res = {}
     try:
         for line in yield_lines(path):
+            m = _has_prefix_pat.match(line)
+            if m:
+                groups = m.groups()
+                res[_first_group(groups, 6)] = (_first_group(groups, 0),
+                                                _first_group(groups, 3))
+                continue
+            # fall back to shlex for anything the fast path cannot parse
             try:
                 placeholder, mode, f = [x.strip('"\'') for x in
                                         shlex.split(line, posix=False)]
@@ -309,6 +716,10 @@ def read_has_prefix(path):
 class PaddingError(Exception):
     pass
 
+# compiled patterns per placeholder; in practice `a` is almost always
+# prefix_placeholder, so this amounts to one compile per process
+_binary_replace_pats = {}
+
 def binary_replace(data, a, b):
     """
     Perform a binary replacement of `data`, where the placeholder `a` is
@@ -322,7 +733,10 @@ def binary_replace(data, a, b):
         if padding < 0:
             raise PaddingError(a, b, padding)
         return match.group().replace(a, b) + b'\0' * padding
-    pat = re.compile(re.escape(a) + b'([^\0]*?)\0')
+    pat = _binary_replace_pats.get(a)
+    if pat is None:
+        pat = _binary_replace_pats[a] = re.compile(re.escape(a) +
+                                                   b'([^\0]*?)\0')
     res = pat.sub(replace, data)
     assert len(res) == len(data)
     return res
@@ -335,13 +749,28 @@ def update_prefix(path, new_prefix, placeholder=prefix_placeholder,
         new_prefix = new_prefix.replace('\\', '/')
 
     path = os.path.realpath(path)
+    placeholder_bytes = placeholder.encode('utf-8')
     with open(path, 'rb') as fi:
-        data = fi.read()
+        try:
+            mm = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError, EnvironmentError):
+            # zero-length files (among others) cannot be mapped
+            data = fi.read()
+        else:
+            try:
+                # most files do not contain the placeholder at all; let
+                # the kernel scan the mapped pages and skip the full
+                # read+rewrite in that case
+                if mm.find(placeholder_bytes) == -1:
+                    return
+                data = mm[:]
+            finally:
+                mm.close()
     if mode == 'text':
-        new_data = data.replace(placeholder.encode('utf-8'),
+        new_data = data.replace(placeholder_bytes,
                                 new_prefix.encode('utf-8'))
     elif mode == 'binary':
-        new_data = binary_replace(data, placeholder.encode('utf-8'),
+        new_data = binary_replace(data, placeholder_bytes,
                                   new_prefix.encode('utf-8'))
     else:
         sys.exit("Invalid mode:" % mode)
@@ -359,6 +788,14 @@ def update_prefix(path, new_prefix, placeholder=prefix_placeholder,
 def name_dist(dist):
     return dist.rsplit('-', 2)[0]
 
+try:
+    # called over and over for the same dists from the solver and the
+    # link/unlink loops; a dict hit beats re-splitting the string
+    name_dist = functools.lru_cache(maxsize=4096)(name_dist)
+except AttributeError:
+    # Python 2: functools has no lru_cache, the plain helper is fine
+    pass
+
 
 def create_meta(prefix, dist, info_dir, extra_info):
     """
@@ -366,15 +803,27 @@ def create_meta(prefix, dist, info_dir, extra_info):
     """
     # read info/index.json first
     with open(join(info_dir, 'index.json')) as fi:
-        meta = json.load(fi)
+        meta = _json_loads(fi.read())
     # add extra info
     meta.update(extra_info)
-    # write into <env>/conda-meta/<dist>.json
+    # write into <env>/conda-meta/<dist>.json, going through a temp file
+    # plus an atomic rename so a crash mid-write cannot leave a corrupt
+    # meta file behind to break linked_data() on the next run
     meta_dir = join(prefix, 'conda-meta')
     if not isdir(meta_dir):
         os.makedirs(meta_dir)
-    with open(join(meta_dir, dist + '.json'), 'w') as fo:
-        json.dump(meta, fo, indent=2, sort_keys=True)
+    meta_path = join(meta_dir, dist + '.json')
+    with open(meta_path + '.tmp', 'w') as fo:
+        fo.write(_json_dumps(meta))
+    replace = getattr(os, 'replace', None)
+    if replace is None:
+        # Python 2: os.rename already overwrites atomically on posix,
+        # but raises on Windows when the destination exists (routine
+        # when re-linking an installed dist), so clear it first there
+        if on_win and isfile(meta_path):
+            os.unlink(meta_path)
+        replace = os.rename
+    replace(meta_path + '.tmp', meta_path)
 
 
 def mk_menus(prefix, files, remove=False):
@@ -435,21 +884,41 @@ def run_script(prefix, dist, action='post-link', env_prefix=None):
     if action == 'pre-link':
         env['SOURCE_DIR'] = str(prefix)
     try:
-        subprocess.check_call(args, env=env)
+        if on_win:
+            subprocess.check_call(args, env=env)
+        else:
+            # close_fds=True (the POSIX default) walks the whole fd
+            # table before exec, which is slow with high fd rlimits;
+            # the short-lived link scripts don't need it
+            subprocess.check_call(args, env=env, close_fds=False)
     except subprocess.CalledProcessError:
         return False
     return True
 
 
+# cache of parsed urls.txt files: pkgs_dir -> ((mtime, size), urls),
+# with the urls in reverse order, since the most recently appended entry
+# for a dist is the one that counts
+_urls_txt_cache = {}
+
 def read_url(pkgs_dir, dist):
+    path = join(pkgs_dir, 'urls.txt')
     try:
-        data = open(join(pkgs_dir, 'urls.txt')).read()
-        urls = data.split()
-        for url in urls[::-1]:
-            if url.endswith('/%s.tar.bz2' % dist):
-                return url
-    except IOError:
-        pass
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime, st.st_size)
+    cached = _urls_txt_cache.get(pkgs_dir)
+    if cached is None or cached[0] != stamp:
+        try:
+            data = open(path).read()
+        except IOError:
+            return None
+        cached = _urls_txt_cache[pkgs_dir] = (stamp, data.split()[::-1])
+    suffix = '/%s.tar.bz2' % dist
+    for url in cached[1]:
+        if url.endswith(suffix):
+            return url
     return None
 
 
@@ -467,7 +936,7 @@ def read_no_link(info_dir):
     res = set()
     for fn in 'no_link', 'no_softlink':
         try:
-            res.update(set(yield_lines(join(info_dir, fn))))
+            res.update(_read_lines(join(info_dir, fn)))
         except IOError:
             pass
     return res
@@ -547,9 +1016,115 @@ def extracted(pkgs_dir):
     """
     if not isdir(pkgs_dir):
         return set()
-    return set(dn for dn in os.listdir(pkgs_dir)
-               if (isfile(join(pkgs_dir, dn, 'info', 'files')) and
-                   isfile(join(pkgs_dir, dn, 'info', 'index.json'))))
+    res = set()
+    if scandir is None:
+        # Python < 3.5; the sentinel checks reject the tarballs anyway
+        for fn in os.listdir(pkgs_dir):
+            info_dir = join(pkgs_dir, fn, 'info')
+            if (isfile(join(info_dir, 'files')) and
+                    isfile(join(info_dir, 'index.json'))):
+                res.add(fn)
+        return res
+    # scandir's cached file type skips the tarballs without stat'ing them
+    it = scandir(pkgs_dir)
+    try:
+        for entry in it:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            info_dir = join(entry.path, 'info')
+            if (isfile(join(info_dir, 'files')) and
+                    isfile(join(info_dir, 'index.json'))):
+                res.add(entry.name)
+    finally:
+        _close_scandir(it)
+    return res
+
+def _write_member(dst, data, mode, mtime):
+    """
+    Write one extracted archive member to disk, creating missing parent
+    directories for archives that omit the directory entries.  Runs on a
+    worker thread during extract().
+    """
+    try:
+        fo = open(dst, 'wb')
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            raise
+        try:
+            os.makedirs(dirname(dst))
+        except OSError as e2:
+            if e2.errno != errno.EEXIST:
+                raise
+        fo = open(dst, 'wb')
+    with fo:
+        fo.write(data)
+    os.chmod(dst, mode)
+    os.utime(dst, (mtime, mtime))
+
+# upper bound on extracted-but-unwritten bytes held by pending futures
+_EXTRACT_MAX_PENDING = 64 << 20
+
+def _extract_threaded(t, path, nthreads):
+    """
+    Extract the tarfile `t` into `path`.  The bzip2 stream can only be
+    decompressed sequentially, so members are read on the calling thread,
+    but the file writes (the other half of the wall time) are fanned out
+    to a small thread pool.
+    """
+    futures = []
+    directories = []
+
+    def drain(futures=futures):
+        for future in futures:
+            future.result()
+        del futures[:]
+        return 0
+
+    pending = 0
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        for member in t:
+            if member.isfile() and not member.islnk():
+                if member.size >= _EXTRACT_MAX_PENDING:
+                    # never materialize a huge member: extract() streams
+                    # it through the copy buffer instead, while smaller
+                    # pending writes keep going on the pool
+                    t.extract(member, path=path)
+                    continue
+                data = t.extractfile(member).read()
+                pending += len(data)
+                futures.append(executor.submit(
+                    _write_member, join(path, member.name),
+                    data, member.mode, member.mtime))
+                if pending >= _EXTRACT_MAX_PENDING:
+                    # bound the *bytes* held in memory, not the future
+                    # count: a handful of huge members must not pile up
+                    # gigabytes of file data
+                    pending = drain()
+            else:
+                # directories, links and special files are order-sensitive
+                # (a hardlink member needs its target on disk already), so
+                # drain the pending writes and extract them here
+                pending = drain()
+                if member.isdir():
+                    # like extractall: create directories 0700 and defer
+                    # their real attributes until every file is written,
+                    # or a read-only directory member would make its own
+                    # contents fail with EACCES
+                    directories.append(member)
+                    member = copy.copy(member)
+                    member.mode = 0o700
+                t.extract(member, path=path)
+        drain()
+
+    # children before parents, as extractall does
+    directories.sort(key=lambda m: m.name, reverse=True)
+    for member in directories:
+        dirpath = join(path, member.name)
+        try:
+            os.chmod(dirpath, member.mode)
+            os.utime(dirpath, (member.mtime, member.mtime))
+        except OSError as e:
+            log.warn("Cannot set attributes on %s: %s" % (dirpath, e))
 
 def extract(pkgs_dir, dist):
     """
@@ -558,8 +1133,18 @@ def extract(pkgs_dir, dist):
     """
     with Locked(pkgs_dir):
         path = join(pkgs_dir, dist)
-        t = tarfile.open(path + '.tar.bz2')
-        t.extractall(path=path)
+        try:
+            # a 1 MiB copy buffer instead of the 16 KiB default cuts the
+            # read/write syscall count ~60x on multi-MB members
+            t = tarfile.open(path + '.tar.bz2', copybufsize=1 << 20)
+        except TypeError:
+            # copybufsize is not available on older Pythons
+            t = tarfile.open(path + '.tar.bz2')
+        nthreads = int(os.environ.get('CONDA_EXTRACT_THREADS', '3'))
+        if ThreadPoolExecutor is None or nthreads < 2:
+            t.extractall(path=path)
+        else:
+            _extract_threaded(t, path, nthreads)
         t.close()
         if sys.platform.startswith('linux') and os.getuid() == 0:
             # When extracting as root, tarfile will by restore ownership
@@ -571,8 +1156,9 @@ def extract(pkgs_dir, dist):
                     os.lchown(p, 0, 0)
 
 def is_extracted(pkgs_dir, dist):
-    return (isfile(join(pkgs_dir, dist, 'info', 'files')) and
-            isfile(join(pkgs_dir, dist, 'info', 'index.json')))
+    info_dir = join(pkgs_dir, dist, 'info')
+    return (isfile(join(info_dir, 'files')) and
+            isfile(join(info_dir, 'index.json')))
 
 def rm_extracted(pkgs_dir, dist):
     with Locked(pkgs_dir):
@@ -588,13 +1174,49 @@ def linked_data(prefix):
     res = {}
     meta_dir = join(prefix, 'conda-meta')
     if isdir(meta_dir):
-        for fn in os.listdir(meta_dir):
-            if fn.endswith('.json'):
-                try:
-                    with open(join(meta_dir, fn)) as fin:
-                        res[fn[:-5]] = json.load(fin)
-                except IOError:
-                    pass
+        if scandir is not None:
+            # scandir hands back the file type from the directory entry,
+            # so filtering costs no extra stat per file
+            it = scandir(meta_dir)
+            try:
+                fnames = [entry.name for entry in it
+                          if entry.name.endswith('.json') and
+                          entry.is_file(follow_symlinks=False)]
+            finally:
+                _close_scandir(it)
+        else:
+            # Python < 3.5
+            fnames = [fn for fn in os.listdir(meta_dir)
+                      if fn.endswith('.json')]
+
+        def load(fn):
+            try:
+                with open(join(meta_dir, fn)) as fin:
+                    # per-key dict assignment is atomic in CPython, so
+                    # the workers need no extra locking
+                    res[fn[:-5]] = _json_loads(fin.read())
+            except IOError:
+                pass
+
+        if (liburing is not None and not on_win and
+                sys.platform.startswith('linux') and len(fnames) >= 10):
+            try:
+                blobs = _read_meta_files_uring(meta_dir, fnames)
+            except (OSError, AttributeError):
+                pass
+            else:
+                for fn, raw in blobs.items():
+                    res[fn[:-5]] = _json_loads(raw)
+                return res
+
+        # overlap the many small meta-file reads; not worth the pool
+        # startup for a handful of packages
+        if ThreadPoolExecutor is None or len(fnames) < 10:
+            for fn in fnames:
+                load(fn)
+        else:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(load, fnames))
     return res
 
 def linked(prefix):
@@ -615,7 +1237,7 @@ def is_linked(prefix, dist):
     meta_path = join(prefix, 'conda-meta', dist + '.json')
     try:
         with open(meta_path) as fi:
-            return json.load(fi)
+            return _json_loads(fi.read())
     except IOError:
         return None
 
@@ -640,12 +1262,28 @@ def move_to_trash(prefix, f, tempdir=None):
     """
     return move_path_to_trash(join(prefix, f))
 
+# whether this process already tried to empty the trash; emptying it on
+# every move made linking environments with many pre-existing files
+# quadratic on Windows
+_trash_deleted_this_run = False
+
+def reset_trash_delete_flag():
+    """
+    Make the next move_path_to_trash call try to empty the trash again
+    (for long-running processes).
+    """
+    global _trash_deleted_this_run
+    _trash_deleted_this_run = False
+
 def move_path_to_trash(path):
     """
     Move a path to the trash
     """
-    # Try deleting the trash every time we use it.
-    delete_trash()
+    # Try deleting the trash once per process.
+    global _trash_deleted_this_run
+    if not _trash_deleted_this_run:
+        delete_trash()
+        _trash_deleted_this_run = True
 
     from conda import config
 
@@ -682,11 +1320,66 @@ def move_path_to_trash(path):
 def load_meta(prefix, dist):
     return is_linked(prefix, dist)
 
-def link(pkgs_dir, prefix, dist, linktype=LINK_HARD, index=None):
-    '''
-    Set up a package in a specified (environment) prefix.  We assume that
-    the package has been extracted (using extract() above).
-    '''
+def _unlink_existing(dst):
+    log.warn("file already exists: %r" % dst)
+    try:
+        os.unlink(dst)
+    except OSError:
+        log.error('failed to unlink: %r' % dst)
+        if on_win:
+            try:
+                move_path_to_trash(dst)
+            except ImportError:
+                # This shouldn't be an issue in the installer anyway
+                pass
+
+# running count of files _link_one failed on; main() watches it to
+# detect a stale .linktype verdict (see the marker handling there)
+_link_errors = 0
+
+def _link_one(src, dst, lt):
+    """
+    Link (or copy) a single file from src to dst, removing any file which
+    already exists at dst.  This is the per-file unit of work for link(),
+    and is safe to run on a worker thread.
+    """
+    global _link_errors
+    if lt == LINK_COPY:
+        # a copy must not write through an existing dst (it could be a
+        # hardlink into the package cache), so this path keeps the
+        # explicit probe before removing it
+        if os.path.exists(dst):
+            _unlink_existing(dst)
+    else:
+        # hard and soft links fail with EEXIST, so rather than paying a
+        # stat per file for the rare already-exists case, just try the
+        # link and clobber dst only when the kernel tells us to
+        try:
+            _link(src, dst, lt)
+            return
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                _link_errors += 1
+                log.error('failed to link (src=%r, dst=%r, type=%r, error=%r)'
+                          % (src, dst, lt, e))
+                return
+        _unlink_existing(dst)
+
+    try:
+        _link(src, dst, lt)
+    except OSError as e:
+        _link_errors += 1
+        log.error('failed to link (src=%r, dst=%r, type=%r, error=%r)' %
+                  (src, dst, lt, e))
+
+def _link_package(pkgs_dir, prefix, dist, linktype=LINK_HARD, index=None):
+    """
+    The body of link(), factored out so that main() can hold the prefix
+    and pkgs_dir locks once around many packages: conda.lock.Locked is
+    per-process and not reentrant, so taking it per package would make
+    concurrent workers serialize against (and eventually time out on)
+    each other.  Callers must already hold both locks.
+    """
     index = index or {}
     log.debug('pkgs_dir=%r, prefix=%r, dist=%r, linktype=%r' %
               (pkgs_dir, prefix, dist, linktype))
@@ -696,81 +1389,129 @@ def link(pkgs_dir, prefix, dist, linktype=LINK_HARD, index=None):
         sys.exit('Error: pre-link failed: %s' % dist)
 
     info_dir = join(source_dir, 'info')
-    files = list(yield_lines(join(info_dir, 'files')))
+    files = _read_lines(join(info_dir, 'files'))
     has_prefix_files = read_has_prefix(join(info_dir, 'has_prefix'))
     no_link = read_no_link(info_dir)
 
-    with Locked(prefix), Locked(pkgs_dir):
-        for f in files:
-            src = join(source_dir, f)
-            dst = join(prefix, f)
-            dst_dir = dirname(dst)
-            if not isdir(dst_dir):
-                os.makedirs(dst_dir)
-            if os.path.exists(dst):
-                log.warn("file already exists: %r" % dst)
-                try:
-                    os.unlink(dst)
-                except OSError:
-                    log.error('failed to unlink: %r' % dst)
-                    if on_win:
-                        try:
-                            move_path_to_trash(dst)
-                        except ImportError:
-                            # This shouldn't be an issue in the installer anyway
-                            pass
-
-            lt = linktype
-            if f in has_prefix_files or f in no_link or islink(src):
-                lt = LINK_COPY
-            try:
-                _link(src, dst, lt)
-            except OSError as e:
-                log.error('failed to link (src=%r, dst=%r, type=%r, error=%r)' %
-                          (src, dst, lt, e))
+    # create the destination directories up front: collect the
+    # ancestor closure of every file's dirname, then sort it, which
+    # groups parents before children — one os.mkdir per directory
+    # instead of makedirs re-stat'ing the whole ancestor chain
+    try:
+        os.makedirs(prefix)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    dirs = set()
+    for f in files:
+        d = dirname(f)
+        while d and d not in dirs:
+            dirs.add(d)
+            d = dirname(d)
+    for d in sorted(dirs):
+        try:
+            os.mkdir(join(prefix, d))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
 
-        if name_dist(dist) == '_cache':
-            return
+    # the linktype classification depends on has_prefix_files/no_link,
+    # so keep it here and hand the workers pre-classified tasks
+    tasks = []
+    for f in files:
+        lt = linktype
+        if f in has_prefix_files or f in no_link or islink(join(source_dir, f)):
+            lt = LINK_COPY
+        tasks.append((join(source_dir, f), join(prefix, f), lt))
+
+    # linking is syscall-bound, so overlapping the syscalls across a few
+    # threads helps, in particular on high-latency (network) filesystems
+    nthreads = int(os.environ.get('CONDA_LINK_THREADS', '4'))
+    if ThreadPoolExecutor is None or nthreads < 2 or len(tasks) < 2:
+        for src, dst, lt in tasks:
+            _link_one(src, dst, lt)
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            futures = [executor.submit(_link_one, src, dst, lt)
+                       for src, dst, lt in tasks]
+            # surface unexpected errors on the main thread
+            for future in futures:
+                future.result()
+
+    if name_dist(dist) == '_cache':
+        return
 
-        for f in sorted(has_prefix_files):
-            placeholder, mode = has_prefix_files[f]
-            try:
-                update_prefix(join(prefix, f), prefix, placeholder, mode)
-            except PaddingError:
-                sys.exit("ERROR: placeholder '%s' too short in: %s\n" %
-                         (placeholder, dist))
+    for f in sorted(has_prefix_files):
+        placeholder, mode = has_prefix_files[f]
+        try:
+            update_prefix(join(prefix, f), prefix, placeholder, mode)
+        except PaddingError:
+            sys.exit("ERROR: placeholder '%s' too short in: %s\n" %
+                     (placeholder, dist))
+
+    mk_menus(prefix, files, remove=False)
+
+    if not run_script(prefix, dist, 'post-link'):
+        sys.exit("Error: post-link failed for: %s" % dist)
+
+    # Make sure the script stays standalone for the installer
+    try:
+        from conda.config import remove_binstar_tokens
+    except ImportError:
+        # There won't be any binstar tokens in the installer anyway
+        def remove_binstar_tokens(url):
+            return url
+
+    meta_dict = index.get(dist + '.tar.bz2', {})
+    meta_dict['url'] = read_url(pkgs_dir, dist)
+    if meta_dict['url']:
+        meta_dict['url'] = remove_binstar_tokens(meta_dict['url'])
+    try:
+        alt_files_path = join(prefix, 'conda-meta', dist + '.files')
+        meta_dict['files'] = _read_lines(alt_files_path)
+        os.unlink(alt_files_path)
+    except IOError:
+        meta_dict['files'] = files
+    meta_dict['link'] = {'source': source_dir,
+                         'type': link_name_map.get(linktype)}
+    if 'channel' in meta_dict:
+        meta_dict['channel'] = remove_binstar_tokens(meta_dict['channel'])
+    if 'icon' in meta_dict:
+        meta_dict['icondata'] = read_icondata(source_dir)
+
+    create_meta(prefix, dist, info_dir, meta_dict)
 
-        mk_menus(prefix, files, remove=False)
+def link(pkgs_dir, prefix, dist, linktype=LINK_HARD, index=None):
+    '''
+    Set up a package in a specified (environment) prefix.  We assume that
+    the package has been extracted (using extract() above).
+    '''
+    with Locked(prefix), Locked(pkgs_dir):
+        _link_package(pkgs_dir, prefix, dist, linktype, index)
 
-        if not run_script(prefix, dist, 'post-link'):
-            sys.exit("Error: post-link failed for: %s" % dist)
 
-        # Make sure the script stays standalone for the installer
+# on_win never changes at runtime, so pick the unlink variant once at
+# import time and keep the platform branch out of the per-file loop
+if on_win:
+    def _safe_unlink(dst):
         try:
-            from conda.config import remove_binstar_tokens
-        except ImportError:
-            # There won't be any binstar tokens in the installer anyway
-            def remove_binstar_tokens(url):
-                return url
-
-        meta_dict = index.get(dist + '.tar.bz2', {})
-        meta_dict['url'] = read_url(pkgs_dir, dist)
-        if meta_dict['url']:
-            meta_dict['url'] = remove_binstar_tokens(meta_dict['url'])
+            os.unlink(dst)
+        except OSError:  # file might not exist
+            log.debug("could not remove file: '%s'" % dst)
+            if os.path.exists(dst):
+                try:
+                    log.debug("moving to trash")
+                    move_path_to_trash(dst)
+                except ImportError:
+                    # This shouldn't be an issue in the installer anyway
+                    #   but it can potentially happen with importing conda.config
+                    log.debug("cannot import conda.config; probably not an issue")
+else:
+    def _safe_unlink(dst):
         try:
-            alt_files_path = join(prefix, 'conda-meta', dist + '.files')
-            meta_dict['files'] = list(yield_lines(alt_files_path))
-            os.unlink(alt_files_path)
-        except IOError:
-            meta_dict['files'] = files
-        meta_dict['link'] = {'source': source_dir,
-                             'type': link_name_map.get(linktype)}
-        if 'channel' in meta_dict:
-            meta_dict['channel'] = remove_binstar_tokens(meta_dict['channel'])
-        if 'icon' in meta_dict:
-            meta_dict['icondata'] = read_icondata(source_dir)
-
-        create_meta(prefix, dist, info_dir, meta_dict)
+            os.unlink(dst)
+        except OSError:  # file might not exist
+            log.debug("could not remove file: '%s'" % dst)
 
 
 def unlink(prefix, dist):
@@ -781,53 +1522,120 @@ def unlink(prefix, dist):
     with Locked(prefix):
         run_script(prefix, dist, 'pre-unlink')
 
-        meta_path = join(prefix, 'conda-meta', dist + '.json')
+        # prefix is fixed and the entries are all relative, so plain
+        # concatenation replaces os.path.join in the per-file loop
+        _pj = prefix + os.sep
+        meta_path = _pj + 'conda-meta' + os.sep + dist + '.json'
         with open(meta_path) as fi:
-            meta = json.load(fi)
+            meta = _json_loads(fi.read())
 
         mk_menus(prefix, meta['files'], remove=True)
-        dst_dirs1 = set()
 
-        for f in meta['files']:
-            dst = join(prefix, f)
-            dst_dirs1.add(dirname(dst))
+        dsts = []
+        # trie keyed on path components; every internal node is an
+        # ancestor directory of some file, so the per-file ancestor
+        # walk is one dict descent instead of repeated dirname() calls
+        # and full-path hashing
+        dir_trie = {}
+        # bind everything the loop touches to locals; LOAD_FAST beats
+        # LOAD_GLOBAL/LOAD_METHOD when this runs for every file of a
+        # large package
+        _files = meta['files']
+        _append = dsts.append
+        for f in _files:
+            _append(_pj + f)
+            node = dir_trie
+            parts = f.split('/')
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+
+        remaining = dsts
+        if liburing is not None and not on_win and \
+                sys.platform.startswith('linux'):
             try:
-                os.unlink(dst)
-            except OSError:  # file might not exist
-                log.debug("could not remove file: '%s'" % dst)
-                if on_win and os.path.exists(join(prefix, f)):
-                    try:
-                        log.debug("moving to trash")
-                        move_path_to_trash(dst)
-                    except ImportError:
-                        # This shouldn't be an issue in the installer anyway
-                        #   but it can potentially happen with importing conda.config
-                        log.debug("cannot import conda.config; probably not an issue")
+                # batch the unlinks through io_uring; whatever fails
+                # falls through to the serial loop for its usual error
+                # handling
+                remaining = _unlink_all_uring(dsts)
+            except (OSError, AttributeError):
+                remaining = dsts
+
+        _su = _safe_unlink
+        for dst in remaining:
+            _su(dst)
 
         # remove the meta-file last
         os.unlink(meta_path)
 
-        dst_dirs2 = set()
-        for path in dst_dirs1:
-            while len(path) > len(prefix):
-                dst_dirs2.add(path)
-                path = dirname(path)
+        # post-order DFS of the trie emits every ancestor directory
+        # with children strictly before their parents
+        def emit_dirs(node, base, out):
+            for name, child in node.items():
+                path = base + os.sep + name
+                emit_dirs(child, path, out)
+                out.append(path)
+
+        empty_dirs = []
+        emit_dirs(dir_trie, prefix, empty_dirs)
         # in case there is nothing left
-        dst_dirs2.add(join(prefix, 'conda-meta'))
-        dst_dirs2.add(prefix)
+        empty_dirs.append(_pj + 'conda-meta')
+        empty_dirs.append(prefix)
+        if liburing is not None and not on_win and \
+                sys.platform.startswith('linux'):
+            try:
+                _rmdir_all_uring(empty_dirs)
+                return
+            except (OSError, AttributeError):
+                pass
 
-        for path in sorted(dst_dirs2, key=len, reverse=True):
+        for path in empty_dirs:
             rm_empty_dir(path)
 
 
 def messages(prefix):
     path = join(prefix, '.messages.txt')
     try:
-        with open(path) as fi:
-            sys.stdout.write(fi.read())
-    except IOError:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        rm_rf(path)
+        return
+    try:
+        size = os.fstat(fd).st_size
+        sys.stdout.flush()
+        offset = 0
+        try:
+            # splice the file to stdout kernel-side: no decode,
+            # re-encode or userspace copy of the message bytes
+            out_fd = sys.stdout.fileno()
+            while offset < size:
+                sent = os.sendfile(out_fd, fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, ValueError, OSError, IOError):
+            # no os.sendfile on this platform, stdout is not a real
+            # file descriptor, or the target fd refused the splice:
+            # plain bytes read/write, still without the codec layer.
+            # sendfile with an explicit offset never moves the fd
+            # position, so seek past whatever it already sent
+            os.lseek(fd, offset, 0)
+            chunks = []
+            while True:
+                chunk = os.read(fd, 262144)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            data = b''.join(chunks)
+            buffer = getattr(sys.stdout, 'buffer', None)
+            if buffer is not None:
+                buffer.write(data)
+            else:
+                # captured stdout (e.g. under the test runner)
+                sys.stdout.write(data.decode('utf-8', 'replace'))
+    except OSError:
         pass
     finally:
+        os.close(fd)
         rm_rf(path)
 
 
@@ -837,85 +1645,249 @@ def duplicates_to_remove(linked_dists, keep_dists):
     only one distribution (for each name) remains.  `keep_dists` is an
     interable of distributions (which are not allowed to be removed).
     """
-    from collections import defaultdict
-
-    keep_dists = set(keep_dists)
-    ldists = defaultdict(set)  # map names to set of distributions
-    for dist in linked_dists:
-        name = name_dist(dist)
-        ldists[name].add(dist)
-
-    res = set()
-    for dists in ldists.values():
-        # `dists` is the group of packages with the same name
+    linked_dists = list(linked_dists)
+    names = [name_dist(d) for d in linked_dists]
+    if len(set(names)) == len(names):
+        # the common case -- no name appears twice -- needs none of the
+        # sorting and grouping below
+        return []
+    keep_dists = frozenset(keep_dists)
+    res = []
+    for name, group in groupby(sorted(linked_dists, key=name_dist),
+                               key=name_dist):
+        # `group` are the packages with the same name
+        dists = list(group)
         if len(dists) == 1:
             # if there is only one package, nothing has to be removed
             continue
-        if dists & keep_dists:
-            # if the group has packages which are have to be kept, we just
-            # take the set of packages which are in group but not in the
+        if any(d in keep_dists for d in dists):
+            # if the group has packages which have to be kept, we just
+            # take the packages which are in the group but not in the
             # ones which have to be kept
-            res.update(dists - keep_dists)
+            res.extend(d for d in dists if d not in keep_dists)
         else:
-            # otherwise, we take lowest (n-1) (sorted) packages
-            res.update(sorted(dists)[:-1])
+            # otherwise, everything but the highest package goes; a
+            # single max() pass replaces sorting the whole group
+            winner = max(dists)
+            res.extend(d for d in dists if d != winner)
     return sorted(res)
 
 
 # =========================== end API functions ==========================
 
 
-def main():
-    from optparse import OptionParser
-
-    p = OptionParser(description="conda link tool used by installer")
+_USAGE = """\
+usage: %s [--file FILE] [--prefix PREFIX] [-v]
 
-    p.add_option('--file',
-                 action="store",
-                 help="path of a file containing distributions to link, "
-                      "by default all packages extracted in the cache are "
-                      "linked")
+conda link tool used by installer
 
-    p.add_option('--prefix',
-                 action="store",
-                 default=sys.prefix,
-                 help="prefix (defaults to %default)")
+  --file FILE      path of a file containing distributions to link, by
+                   default all packages extracted in the cache are linked
+  --prefix PREFIX  prefix (defaults to sys.prefix)
+  -v, --verbose
+"""
 
-    p.add_option('-v', '--verbose',
-                 action="store_true")
+def _arg_error(msg):
+    # optparse compatibility: complain on stderr and exit 2
+    sys.stderr.write('Error: %s\n' % msg)
+    sys.exit(2)
 
-    opts, args = p.parse_args()
-    if args:
-        p.error('no arguments expected')
+def main():
+    # this script runs once per install as a subprocess on some
+    # platforms, so keep startup lean: three options do not need
+    # optparse
+    opt_file = None
+    opt_prefix = sys.prefix
+    verbose = False
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ('-v', '--verbose'):
+            verbose = True
+        elif arg == '--file':
+            i += 1
+            if i == len(args):
+                _arg_error('--file requires a value')
+            opt_file = args[i]
+        elif arg.startswith('--file='):
+            opt_file = arg[len('--file='):]
+        elif arg == '--prefix':
+            i += 1
+            if i == len(args):
+                _arg_error('--prefix requires a value')
+            opt_prefix = args[i]
+        elif arg.startswith('--prefix='):
+            opt_prefix = arg[len('--prefix='):]
+        elif arg in ('-h', '--help'):
+            sys.stdout.write(_USAGE % sys.argv[0])
+            return
+        else:
+            _arg_error('no arguments expected, got %r' % arg)
+        i += 1
 
+    # configure the root handler unconditionally: a quiet run must
+    # still surface log.error/log.warn from failed links and unlinks
     logging.basicConfig()
 
-    prefix = opts.prefix
+    prefix = opt_prefix
     pkgs_dir = join(prefix, 'pkgs')
-    if opts.verbose:
+    if verbose:
         print("prefix: %r" % prefix)
 
-    if opts.file:
-        idists = list(yield_lines(join(prefix, opts.file)))
+    if opt_file:
+        idists = list(yield_lines(join(prefix, opt_file)))
     else:
-        idists = sorted(extracted(pkgs_dir))
-
-    linktype = (LINK_HARD
-                if try_hard_link(pkgs_dir, prefix, idists[0]) else
-                LINK_COPY)
-    if opts.verbose:
+        # inlined extracted(): one scandir pass over the cache using the
+        # cached d_type, with os.access probing the sentinel files (one
+        # existence check instead of a full stat each)
+        idists = []
+        if isdir(pkgs_dir) and scandir is not None:
+            it = scandir(pkgs_dir)
+            try:
+                for entry in it:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    info_dir = join(entry.path, 'info')
+                    if (os.access(join(info_dir, 'files'), os.F_OK) and
+                            os.access(join(info_dir, 'index.json'),
+                                      os.F_OK)):
+                        idists.append(entry.name)
+            finally:
+                _close_scandir(it)
+        elif isdir(pkgs_dir):
+            # Python < 3.5
+            idists = list(extracted(pkgs_dir))
+        idists.sort()
+
+    # the hard-link probe creates and unlinks a sentinel file on every
+    # run (and can be slow on NFS); its outcome only depends on which
+    # devices pkgs_dir and prefix live on, so persist it per device
+    # pair in conda-meta and reuse it while the pair is unchanged
+    linktype_path = join(prefix, 'conda-meta', '.linktype')
+    try:
+        key = '%d:%d' % (os.stat(pkgs_dir).st_dev, os.stat(prefix).st_dev)
+    except OSError:
+        key = None
+    linktype = None
+    if key is not None:
+        try:
+            with open(linktype_path) as fi:
+                cached_key, cached_type = fi.read().split()
+            if cached_key == key and int(cached_type) in (LINK_HARD,
+                                                          LINK_COPY):
+                linktype = int(cached_type)
+        except (IOError, OSError, ValueError):
+            pass
+    from_cache = linktype is not None
+    if linktype is None:
+        linktype = (LINK_HARD
+                    if try_hard_link(pkgs_dir, prefix, idists[0]) else
+                    LINK_COPY)
+        if key is not None:
+            try:
+                with open(linktype_path, 'w') as fo:
+                    fo.write('%s %d\n' % (key, linktype))
+            except (IOError, OSError):
+                # conda-meta may not exist yet; the probe simply runs
+                # again next time
+                pass
+    if verbose:
         print("linktype: %s" % link_name_map[linktype])
 
-    for dist in idists:
-        if opts.verbose:
+    def link_dist(dist):
+        if verbose:
             print("linking: %s" % dist)
-        link(pkgs_dir, prefix, dist, linktype)
+        _link_package(pkgs_dir, prefix, dist, linktype)
+
+    def has_link_scripts(dist):
+        bin_dir = join(pkgs_dir, dist, 'Scripts' if on_win else 'bin')
+        ext = 'bat' if on_win else 'sh'
+        return any(isfile(join(bin_dir, '.%s-%s.%s' %
+                               (name_dist(dist), action, ext)))
+                   for action in ('pre-link', 'post-link'))
+
+    # hold the locks once around the whole loop; Locked is per-process
+    # and not reentrant, so workers taking it per dist inside link()
+    # would serialize against each other and eventually hit LockError
+    with Locked(prefix), Locked(pkgs_dir):
+        remaining = idists
+        if idists and from_cache:
+            # trust but verify: st_dev numbers for NFS/btrfs/overlay
+            # mounts are assigned at mount time and can collide across
+            # reboots, so a stale LINK_HARD verdict makes every os.link
+            # fail with EXDEV while _link_one only logs each failure.
+            # Watch the first dist and re-probe on any link error
+            # instead of shipping a silently empty environment.
+            errors_before = _link_errors
+            link_dist(idists[0])
+            if _link_errors != errors_before:
+                try:
+                    os.unlink(linktype_path)
+                except OSError:
+                    pass
+                linktype = (LINK_HARD
+                            if try_hard_link(pkgs_dir, prefix, idists[0])
+                            else LINK_COPY)
+                if key is not None:
+                    try:
+                        with open(linktype_path, 'w') as fo:
+                            fo.write('%s %d\n' % (key, linktype))
+                    except (IOError, OSError):
+                        pass
+                # redo the first dist with the corrected verdict
+                link_dist(idists[0])
+            remaining = idists[1:]
+        if (ThreadPoolExecutor is not None and len(remaining) > 4 and
+                not any(has_link_scripts(dist) for dist in remaining)):
+            # dists are disjoint file sets, so they can be linked
+            # concurrently -- but only when none of them ship pre/post
+            # link scripts, which expect earlier dists (e.g. python
+            # itself) to be fully linked and must run in install order
+            try:
+                ncpu = os.cpu_count() or 4
+            except AttributeError:
+                # Python 2
+                import multiprocessing
+                try:
+                    ncpu = multiprocessing.cpu_count()
+                except NotImplementedError:
+                    ncpu = 4
+            with ThreadPoolExecutor(max_workers=min(8, ncpu)) as executor:
+                for future in [executor.submit(link_dist, dist)
+                               for dist in remaining]:
+                    future.result()
+        else:
+            for dist in remaining:
+                link_dist(dist)
+
+    if key is not None and not isfile(linktype_path):
+        # the earlier write fails on a fresh prefix where conda-meta
+        # does not exist yet; persist now that linking created it
+        try:
+            with open(linktype_path, 'w') as fo:
+                fo.write('%s %d\n' % (key, linktype))
+        except (IOError, OSError):
+            pass
 
     messages(prefix)
 
-    for dist in duplicates_to_remove(linked(prefix), idists):
-        meta_path = join(prefix, 'conda-meta', dist + '.json')
-        print("WARNING: unlinking: %s" % meta_path)
+    dups = duplicates_to_remove(linked(prefix), idists)
+    meta_dir = join(prefix, 'conda-meta')
+    for dist in dups:
+        print("WARNING: unlinking: %s" % join(meta_dir, dist + '.json'))
+
+    if dups and liburing is not None and not on_win and \
+            sys.platform.startswith('linux'):
+        try:
+            # batch the renames and fsync the directory once; whatever
+            # fails falls through to the serial rename/rm_rf handling
+            dups = _rename_bak_uring(meta_dir, dups)
+        except (OSError, AttributeError):
+            pass
+
+    for dist in dups:
+        meta_path = join(meta_dir, dist + '.json')
         try:
             os.rename(meta_path, meta_path + '.bak')
         except OSError:
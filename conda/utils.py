@@ -77,11 +77,9 @@ def url_path(path):
     return 'file://%s' % path
 
 
-def win_path_to_unix(path, root_prefix=""):
-    """Convert a path or ;-separated string of paths into a unix representation
-
-    Does not add cygdrive.  If you need that, set root_prefix to "/cygdrive"
-    """
+def _win_path_to_unix_regex(path, root_prefix=""):
+    # the old regex implementation of win_path_to_unix, kept around as
+    # the reference to check the hand-rolled scan against
     path_re = '(?<![:/^a-zA-Z])([a-zA-Z]:[\/\\\\]+(?:[^:*?"<>|]+[\/\\\\]+)*[^:*?"<>|;\/\\\\]+?(?![a-zA-Z]:))'  # noqa
 
     def translation(found_path):
@@ -90,6 +88,68 @@ def win_path_to_unix(path, root_prefix=""):
     return re.sub(path_re, translation, path).replace(";/", ":/")
 
 
+def win_path_to_unix(path, root_prefix=""):
+    """Convert a path or ;-separated string of paths into a unix representation
+
+    Does not add cygdrive.  If you need that, set root_prefix to "/cygdrive"
+    """
+    # A single left-to-right scan of the string.  Agrees with (and is
+    # tested against) _win_path_to_unix_regex on ;-separated PATH-style
+    # strings, whose lookbehind and non-greedy tail backtrack badly on
+    # long inputs.  The implementations intentionally diverge on a drive
+    # spec that follows a converted path without a ';' in between (e.g.
+    # 'C:/ C:\D'): the old regex glued the second drive letter onto the
+    # tail of the first path, the scan converts both specs.
+    out = []
+    pos = 0
+    n = len(path)
+    while pos < n:
+        ch = path[pos]
+        # a drive spec is a letter, a colon and a slash, not preceded by
+        # one of [:/^a-zA-Z]
+        is_drive = (('a' <= ch <= 'z' or 'A' <= ch <= 'Z') and
+                    pos + 2 < n and path[pos + 1] == ':' and
+                    path[pos + 2] in '/\\')
+        if is_drive and pos > 0:
+            prev = path[pos - 1]
+            if prev in ':/^' or 'a' <= prev <= 'z' or 'A' <= prev <= 'Z':
+                is_drive = False
+        if not is_drive:
+            out.append(ch)
+            pos += 1
+            continue
+        # consume the slashes after the drive, then the longest run of
+        # characters allowed inside a windows path
+        s = pos + 2
+        while s < n and path[s] in '/\\':
+            s += 1
+        k = s
+        while k < n and path[k] not in ':*?"<>|':
+            k += 1
+        body = path[s:k]
+        # the converted region ends after the rightmost slash which is
+        # followed by a regular character; with no such slash, it ends
+        # after the first character of the body
+        end = None
+        idx = len(body) - 1
+        while idx > 0:
+            if body[idx - 1] in '/\\' and body[idx] not in ';/\\':
+                end = idx + 1
+                break
+            idx -= 1
+        if end is None:
+            if not body or body[0] == ';':
+                # "C:\" alone is not a path
+                out.append(ch)
+                pos += 1
+                continue
+            end = 1
+        found = path[pos:s + end].replace('\\', '/').replace(':', '')
+        out.append(root_prefix + '/' + found)
+        pos = s + end
+    return ''.join(out).replace(';/', ':/')
+
+
 def unix_path_to_win(path, root_prefix=""):
     """Convert a path or :-separated string of paths into a Windows representation
 
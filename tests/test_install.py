@@ -1,10 +1,12 @@
 from contextlib import contextmanager
+import os
 import random
 import shutil
 import stat
+import sys
 import tempfile
 import unittest
-from os.path import join
+from os.path import exists, join
 
 
 from conda import install
@@ -156,6 +158,11 @@ class rm_rf_file_and_link_TestCase(unittest.TestCase):
         with patch.object(install.shutil, 'rmtree') as rmtree:
             yield rmtree
 
+    @contextmanager
+    def generate_mock_fast_rmtree(self):
+        with patch.object(install, '_fast_rmtree') as fast_rmtree:
+            yield fast_rmtree
+
     @contextmanager
     def generate_mock_sleep(self):
         with patch.object(install.time, 'sleep') as sleep:
@@ -180,27 +187,29 @@ class rm_rf_file_and_link_TestCase(unittest.TestCase):
 
     @contextmanager
     def generate_mocks(self, islink=True, isfile=True, isdir=True, on_win=False, os_access=True):
-        with self.generate_mock_islink(islink) as mock_islink:
-            with self.generate_mock_isfile(isfile) as mock_isfile:
-                with self.generate_mock_os_access(os_access) as mock_os_access:
-                    with self.generate_mock_isdir(isdir) as mock_isdir:
-                        with self.generate_mock_unlink() as mock_unlink:
-                            with self.generate_mock_rmtree() as mock_rmtree:
-                                with self.generate_mock_sleep() as mock_sleep:
-                                    with self.generate_mock_log() as mock_log:
-                                        with self.generate_mock_on_win(on_win):
-                                            with self.generate_mock_check_call() as check_call:
-                                                yield {
-                                                    'islink': mock_islink,
-                                                    'isfile': mock_isfile,
-                                                    'isdir': mock_isdir,
-                                                    'os_access': mock_os_access,
-                                                    'unlink': mock_unlink,
-                                                    'rmtree': mock_rmtree,
-                                                    'sleep': mock_sleep,
-                                                    'log': mock_log,
-                                                    'check_call': check_call,
-                                            }
+        with self.generate_mock_islink(islink) as mock_islink, \
+                self.generate_mock_isfile(isfile) as mock_isfile, \
+                self.generate_mock_os_access(os_access) as mock_os_access, \
+                self.generate_mock_isdir(isdir) as mock_isdir, \
+                self.generate_mock_unlink() as mock_unlink, \
+                self.generate_mock_rmtree() as mock_rmtree, \
+                self.generate_mock_fast_rmtree() as mock_fast_rmtree, \
+                self.generate_mock_sleep() as mock_sleep, \
+                self.generate_mock_log() as mock_log, \
+                self.generate_mock_on_win(on_win), \
+                self.generate_mock_check_call() as check_call:
+            yield {
+                'islink': mock_islink,
+                'isfile': mock_isfile,
+                'isdir': mock_isdir,
+                'os_access': mock_os_access,
+                'unlink': mock_unlink,
+                'rmtree': mock_rmtree,
+                'fast_rmtree': mock_fast_rmtree,
+                'sleep': mock_sleep,
+                'log': mock_log,
+                'check_call': check_call,
+            }
 
     def generate_directory_mocks(self, on_win=False):
         return self.generate_mocks(islink=False, isfile=False, isdir=True,
@@ -268,73 +277,83 @@ class rm_rf_file_and_link_TestCase(unittest.TestCase):
             some_path = self.generate_random_path
             install.rm_rf(some_path)
         self.assertFalse(mocks['rmtree'].called)
+        self.assertFalse(mocks['fast_rmtree'].called)
 
     @skip_if_no_mock
-    def test_calls_rmtree_at_least_once_on_isdir_true(self):
+    def test_calls_fast_rmtree_at_least_once_on_isdir_true(self):
         with self.generate_directory_mocks() as mocks:
             some_path = self.generate_random_path
             install.rm_rf(some_path)
-        mocks['rmtree'].assert_called_with(
-            some_path, onerror=warn_failed_remove, ignore_errors=False)
+        mocks['fast_rmtree'].assert_called_with(
+            some_path, onerror=warn_failed_remove)
 
     @skip_if_no_mock
-    def test_calls_rmtree_only_once_on_success(self):
+    def test_calls_fast_rmtree_only_once_on_success(self):
         with self.generate_directory_mocks() as mocks:
             some_path = self.generate_random_path
             install.rm_rf(some_path)
-        self.assertEqual(1, mocks['rmtree'].call_count)
+        self.assertEqual(1, mocks['fast_rmtree'].call_count)
 
     @skip_if_no_mock
     def test_raises_final_exception_if_it_cant_remove(self):
         with self.generate_directory_mocks() as mocks:
+            mocks['fast_rmtree'].side_effect = OSError
             mocks['rmtree'].side_effect = OSError
             some_path = self.generate_random_path
             with self.assertRaises(OSError):
                 install.rm_rf(some_path)
 
     @skip_if_no_mock
-    def test_retries_six_times_to_ensure_it_cant_really_remove(self):
+    def test_falls_back_to_rmtree_to_ensure_it_cant_really_remove(self):
         with self.generate_directory_mocks() as mocks:
+            mocks['fast_rmtree'].side_effect = OSError
             mocks['rmtree'].side_effect = OSError
             some_path = self.generate_random_path
             with self.assertRaises(OSError):
                 install.rm_rf(some_path)
-        self.assertEqual(6, mocks['rmtree'].call_count)
+        self.assertEqual(5, mocks['fast_rmtree'].call_count)
+        self.assertEqual(1, mocks['rmtree'].call_count)
 
     @skip_if_no_mock
-    def test_retries_as_many_as_max_retries_plus_one(self):
+    def test_retries_as_many_as_max_retries(self):
         max_retries = random.randint(7, 10)
         with self.generate_directory_mocks() as mocks:
+            mocks['fast_rmtree'].side_effect = OSError
             mocks['rmtree'].side_effect = OSError
             some_path = self.generate_random_path
             with self.assertRaises(OSError):
                 install.rm_rf(some_path, max_retries=max_retries)
-        self.assertEqual(max_retries + 1, mocks['rmtree'].call_count)
+        self.assertEqual(max_retries, mocks['fast_rmtree'].call_count)
+        self.assertEqual(1, mocks['rmtree'].call_count)
 
     @skip_if_no_mock
     def test_stops_retrying_after_success(self):
         with self.generate_directory_mocks() as mocks:
-            mocks['rmtree'].side_effect = [OSError, OSError, None]
+            mocks['fast_rmtree'].side_effect = [OSError, OSError, None]
             some_path = self.generate_random_path
             install.rm_rf(some_path)
-        self.assertEqual(3, mocks['rmtree'].call_count)
+        self.assertEqual(3, mocks['fast_rmtree'].call_count)
+        self.assertFalse(mocks['rmtree'].called)
 
     @skip_if_no_mock
-    def test_pauses_for_same_number_of_seconds_as_max_retries(self):
+    def test_pauses_with_capped_exponential_backoff(self):
         with self.generate_directory_mocks() as mocks:
+            mocks['fast_rmtree'].side_effect = OSError
             mocks['rmtree'].side_effect = OSError
             max_retries = random.randint(1, 10)
             with self.assertRaises(OSError):
                 install.rm_rf(self.generate_random_path,
                               max_retries=max_retries)
 
-        expected = [mock.call(i) for i in range(max_retries)]
+        expected = [mock.call(min(0.05 * (2 ** i), 1.0) if i else 0)
+                    for i in range(max_retries)]
         mocks['sleep'].assert_has_calls(expected)
 
     @skip_if_no_mock
     def test_logs_messages_generated_for_each_retry(self):
         with self.generate_directory_mocks() as mocks:
             random_path = self.generate_random_path
+            mocks['fast_rmtree'].side_effect = OSError(random_path)
             mocks['rmtree'].side_effect = OSError(random_path)
             max_retries = random.randint(1, 10)
             with self.assertRaises(OSError):
@@ -343,26 +362,290 @@ class rm_rf_file_and_link_TestCase(unittest.TestCase):
         log_template = "\n".join([
             "Unable to delete %s" % random_path,
             "%s" % OSError(random_path),
-            "Retrying after %d seconds...",
+            "Retrying after %s seconds...",
         ])
 
-        expected_call_list = [mock.call(log_template % i)
-                              for i in range(max_retries)]
+        expected_call_list = [
+            mock.call(log_template % (min(0.05 * (2 ** i), 1.0) if i else 0))
+            for i in range(max_retries)]
         mocks['log'].debug.assert_has_calls(expected_call_list)
 
     @skip_if_no_mock
     def test_tries_extra_kwarg_on_windows(self):
         with self.generate_directory_mocks(on_win=True) as mocks:
             random_path = self.generate_random_path
-            mocks['rmtree'].side_effect = [OSError, None]
+            mocks['fast_rmtree'].side_effect = OSError
             install.rm_rf(random_path)
 
-        expected_call_list = [
-            mock.call(random_path, ignore_errors=False, onerror=warn_failed_remove),
-            mock.call(random_path, onerror=install._remove_readonly)
+        mocks['fast_rmtree'].assert_called_with(
+            random_path, onerror=warn_failed_remove)
+        mocks['rmtree'].assert_called_with(
+            random_path, onerror=install._remove_readonly)
+        self.assertEqual(1, mocks['rmtree'].call_count)
+
+
+class FakeLiburing(object):
+    """
+    Minimal in-process stand-in for the python liburing binding.  SQEs
+    are executed with ordinary os calls at submit time and completions
+    are handed back through the same peek/seen protocol the helpers
+    use, in *reverse* submission order so the user_data bookkeeping is
+    actually exercised.  `queue_init_ret` simulates ring-setup failure;
+    `base_dir` anchors the relative paths renameat receives.
+    """
+    AT_FDCWD = -100
+    AT_REMOVEDIR = 0x200
+
+    class _SQE(object):
+        def __init__(self):
+            self.op = None
+            self.user_data = 0
+
+    class _CQE(object):
+        def __init__(self, res, user_data):
+            self.res = res
+            self.user_data = user_data
+
+    class _CQES(object):
+        def __init__(self):
+            self.current = None
+
+        def __getitem__(self, index):
+            return self.current
+
+    class _Ring(object):
+        def __init__(self):
+            self.pending = []
+            self.completed = []
+
+    def __init__(self, queue_init_ret=0, base_dir=None):
+        self.queue_init_ret = queue_init_ret
+        self.base_dir = base_dir
+        self.executed = []
+        self.exited = False
+
+    def _path(self, p):
+        if not isinstance(p, str):
+            p = p.decode(sys.getfilesystemencoding())
+        if self.base_dir is not None and not os.path.isabs(p):
+            p = join(self.base_dir, p)
+        return p
+
+    def io_uring(self):
+        return self._Ring()
+
+    def io_uring_queue_init(self, entries, ring, flags):
+        return self.queue_init_ret
+
+    def io_uring_get_sqe(self, ring):
+        sqe = self._SQE()
+        ring.pending.append(sqe)
+        return sqe
+
+    def io_uring_prep_unlinkat(self, sqe, dirfd, path, flags):
+        sqe.op = ('unlinkat', path, flags)
+
+    def io_uring_prep_renameat(self, sqe, olddirfd, oldpath,
+                               newdirfd, newpath, flags):
+        sqe.op = ('renameat', oldpath, newpath)
+
+    def io_uring_prep_read(self, sqe, fd, buf, nbytes, offset):
+        sqe.op = ('read', fd, buf, nbytes, offset)
+
+    def io_uring_prep_fsync(self, sqe, fd, flags):
+        sqe.op = ('fsync', fd)
+
+    def _execute(self, op):
+        kind = op[0]
+        try:
+            if kind == 'unlinkat':
+                path = self._path(op[1])
+                if op[2] & self.AT_REMOVEDIR:
+                    os.rmdir(path)
+                else:
+                    os.unlink(path)
+                self.executed.append((kind, path))
+            elif kind == 'renameat':
+                os.rename(self._path(op[1]), self._path(op[2]))
+                self.executed.append((kind, self._path(op[1])))
+            elif kind == 'read':
+                os.lseek(op[1], op[4], 0)
+                data = os.read(op[1], op[3])
+                op[2][:len(data)] = data
+                self.executed.append((kind, op[1]))
+                return len(data)
+            elif kind == 'fsync':
+                self.executed.append((kind, op[1]))
+            return 0
+        except OSError as e:
+            return -e.errno
+
+    def io_uring_submit_and_wait(self, ring, count):
+        for sqe in ring.pending:
+            ring.completed.append(self._CQE(self._execute(sqe.op),
+                                            sqe.user_data))
+        del ring.pending[:]
+
+    def io_uring_cqes(self):
+        return self._CQES()
+
+    def io_uring_peek_cqe(self, ring, cqes):
+        cqes.current = ring.completed.pop()
+
+    def io_uring_cqe_seen(self, ring, cqe):
+        pass
+
+    def io_uring_queue_exit(self, ring):
+        self.exited = True
+
+
+class uring_helpers_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def write_files(self, *names):
+        paths = []
+        for name in names:
+            path = join(self.tmpdir, name)
+            with open(path, 'w') as fo:
+                fo.write('content of %s' % name)
+            paths.append(path)
+        return paths
+
+    @skip_if_no_mock
+    def test_submit_unlink_batch_removes_every_path(self):
+        fake = FakeLiburing()
+        paths = self.write_files('a', 'b', 'c')
+        with patch.object(install, 'liburing', fake):
+            failed = install._uring_submit_unlink_batch(fake.io_uring(),
+                                                        paths)
+        self.assertEqual(failed, [])
+        for path in paths:
+            self.assertFalse(exists(path))
+
+    @skip_if_no_mock
+    def test_submit_unlink_batch_maps_failures_back_to_paths(self):
+        fake = FakeLiburing()
+        good = self.write_files('a', 'c')
+        missing = join(self.tmpdir, 'missing')
+        batch = [good[0], missing, good[1]]
+        with patch.object(install, 'liburing', fake):
+            failed = install._uring_submit_unlink_batch(fake.io_uring(),
+                                                        batch)
+        # completions came back in reverse order; user_data still has
+        # to single out the one path that failed
+        self.assertEqual(failed, [missing])
+        for path in good:
+            self.assertFalse(exists(path))
+
+    @skip_if_no_mock
+    def test_unlink_all_uring_batches_and_returns_failures(self):
+        fake = FakeLiburing()
+        paths = self.write_files('a', 'b', 'c', 'd', 'e')
+        missing = join(self.tmpdir, 'missing')
+        with patch.object(install, 'liburing', fake), \
+                patch.object(install, '_URING_BATCH', 2):
+            failed = install._unlink_all_uring(paths + [missing])
+        self.assertEqual(failed, [missing])
+        self.assertTrue(fake.exited)
+        for path in paths:
+            self.assertFalse(exists(path))
+
+    @skip_if_no_mock
+    def test_unlink_all_uring_raises_when_ring_setup_fails(self):
+        fake = FakeLiburing(queue_init_ret=-1)
+        path = self.write_files('a')[0]
+        with patch.object(install, 'liburing', fake):
+            with self.assertRaises(OSError):
+                install._unlink_all_uring([path])
+        self.assertTrue(exists(path))
+
+    @skip_if_no_mock
+    def test_rmdir_all_uring_removes_children_before_parents(self):
+        fake = FakeLiburing()
+        os.makedirs(join(self.tmpdir, 'a', 'b', 'c'))
+        dirs = [join(self.tmpdir, 'a'),
+                join(self.tmpdir, 'a', 'b'),
+                join(self.tmpdir, 'a', 'b', 'c')]
+        with patch.object(install, 'liburing', fake):
+            install._rmdir_all_uring(dirs)
+        self.assertFalse(exists(dirs[0]))
+        self.assertEqual([path for kind, path in fake.executed],
+                         list(reversed(dirs)))
+
+    @skip_if_no_mock
+    def test_rmdir_all_uring_ignores_failures(self):
+        fake = FakeLiburing()
+        os.makedirs(join(self.tmpdir, 'full'))
+        kept = self.write_files('full/keep.txt')[0]
+        missing = join(self.tmpdir, 'missing')
+        with patch.object(install, 'liburing', fake):
+            install._rmdir_all_uring([join(self.tmpdir, 'full'), missing])
+        self.assertTrue(exists(kept))
+
+    @skip_if_no_mock
+    def test_read_meta_files_uring_returns_file_contents(self):
+        fake = FakeLiburing()
+        self.write_files('p1.json', 'p2.json')
+        with patch.object(install, 'liburing', fake):
+            blobs = install._read_meta_files_uring(self.tmpdir,
+                                                   ['p1.json', 'p2.json'])
+        self.assertEqual(blobs, {'p1.json': b'content of p1.json',
+                                 'p2.json': b'content of p2.json'})
+
+    @skip_if_no_mock
+    def test_read_meta_files_uring_raises_when_ring_setup_fails(self):
+        fake = FakeLiburing(queue_init_ret=-1)
+        self.write_files('p1.json')
+        with patch.object(install, 'liburing', fake):
+            with self.assertRaises(OSError):
+                install._read_meta_files_uring(self.tmpdir, ['p1.json'])
+
+    @skip_if_no_mock
+    def test_rename_bak_uring_renames_with_one_trailing_fsync(self):
+        fake = FakeLiburing(base_dir=self.tmpdir)
+        self.write_files('p1.json', 'p2.json')
+        with patch.object(install, 'liburing', fake):
+            failed = install._rename_bak_uring(self.tmpdir,
+                                               ['p1', 'p2', 'missing'])
+        self.assertEqual(failed, ['missing'])
+        for name in ('p1', 'p2'):
+            self.assertFalse(exists(join(self.tmpdir, name + '.json')))
+            self.assertTrue(exists(join(self.tmpdir, name + '.json.bak')))
+        fsyncs = [op for op in fake.executed if op[0] == 'fsync']
+        self.assertEqual(1, len(fsyncs))
+        self.assertEqual('fsync', fake.executed[-1][0])
+
+    @skip_if_no_mock
+    def test_rename_bak_uring_raises_when_ring_setup_fails(self):
+        fake = FakeLiburing(queue_init_ret=-1, base_dir=self.tmpdir)
+        path = self.write_files('p1.json')[0]
+        with patch.object(install, 'liburing', fake):
+            with self.assertRaises(OSError):
+                install._rename_bak_uring(self.tmpdir, ['p1'])
+        self.assertTrue(exists(path))
+
+
+class win_path_to_unix_standalone_TestCase(unittest.TestCase):
+
+    def test_agrees_with_conda_utils(self):
+        # install.py carries its own copy of win_path_to_unix for the
+        # standalone installer; it must not drift from the original
+        from conda import utils
+        paths = [
+            r";z:\miniconda\Scripts\pip.exe",
+            r";z:\miniconda;z:\Documents (x86)\pip.exe;C:\test",
+            r"C:\a_D:\b",
+            r"C:\a;D:\b",
+            'C:/ C:\\D',
+            "no drive specs here",
         ]
-        mocks['rmtree'].assert_has_calls(expected_call_list)
-        self.assertEqual(2, mocks['rmtree'].call_count)
+        for path in paths:
+            self.assertEqual(install._win_path_to_unix_standalone(path),
+                             utils.win_path_to_unix(path))
 
 
 class duplicates_to_remove_TestCase(unittest.TestCase):
@@ -141,3 +141,31 @@ def test_path_translations():
 
         assert utils.win_path_to_cygwin(windows_path) == cygwin_path
         assert utils.cygwin_path_to_win(cygwin_path) == windows_path
+
+
+def test_win_path_to_unix_matches_old_regex():
+    # on ;-separated PATH-style strings the scanning implementation must
+    # agree with the old regex it replaced, including drive specs whose
+    # preceding character is neither ';' nor part of another path
+    paths = [
+        r";z:\miniconda\Scripts\pip.exe",
+        r";z:\miniconda;z:\Documents (x86)\pip.exe;C:\test",
+        "test dummy text /usr/bin;z:\\documents (x86)\\code\\conda\\tests"
+        "\\envskhkzts\\test1;z:\\documents\\code\\conda\\tests\\envskhkzts"
+        "\\test1\\cmd more dummy text",
+        r"C:\a_D:\b",
+        r"C:\a.D:\b",
+        r"C:\a;D:\b",
+    ]
+    for windows_path in paths:
+        assert (utils.win_path_to_unix(windows_path) ==
+                utils._win_path_to_unix_regex(windows_path))
+
+
+def test_win_path_to_unix_adjacent_drive_specs():
+    # known, intentional divergence: a drive spec directly following a
+    # converted path without a ';' separator.  The old regex glued the
+    # second drive letter onto the tail of the first path; the scan
+    # converts both specs.
+    assert utils.win_path_to_unix('C:/ C:\\D') == '/C/ /C/D'
+    assert utils._win_path_to_unix_regex('C:/ C:\\D') == '/C/ C:\\D'